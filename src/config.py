@@ -8,11 +8,18 @@ IDLE_TIME_PER_HOUSE = 6  # minutes
 # ORS API Configuration
 ORS_API_URL = "http://localhost:8080/ors"
 ORS_PROFILE = "driving-car"
+ORS_MAX_WORKERS = 10  # Concurrent route requests, also the size of the HTTP connection pool
+ORS_MAX_WAYPOINTS = 50  # Waypoints per directions request, ORS default limit
 
 # Data paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "src", "data")
-TEMPLATE_DIR = os.path.join(BASE_DIR, "src", "templates")
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+ROUTE_CACHE_PATH = os.path.join(BASE_DIR, "data", ".route_cache.sqlite")  # Persistent ORS route cache
 
 # Output paths
-OUTPUT_MAP = os.path.join(TEMPLATE_DIR, "route_map.html")
\ No newline at end of file
+OUTPUT_MAP = os.path.join(TEMPLATE_DIR, "route_map.html")
+
+# Map rendering
+ROUTE_SIMPLIFY_TOLERANCE = 5e-5  # Degrees (~5 m), route lines are simplified before drawing
+MAP_COORD_DECIMALS = 6  # ~10 cm, coordinates are rounded to this in the map payload
\ No newline at end of file
@@ -3,36 +3,55 @@ import os
 import argparse
 import logging
 import string
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
 import pandas as pd
 from utils.data_loader import DeliveryDataLoader
 from utils.ors_client import ORSClient
 from models.route_optimizer import RouteOptimizer
-from utils.map_visualizer import MapVisualizer
-from utils.route_validator import RouteValidator
 from config import HUB_LOCATION  # Add this import
 
-# Add project root to path
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(project_root)
-
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Input and output locations, resolved once
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_DIR = os.path.join(SRC_DIR, 'data')
+OUTPUT_DIR = os.path.join(os.path.dirname(SRC_DIR), 'output')
+TEST_LOG_DIR = os.path.join(OUTPUT_DIR, 'test_log')
+MAPS_DIR = os.path.join(OUTPUT_DIR, 'maps')
+
+LOG_FORMATTER = logging.Formatter('%(message)s')  # Validation logs hold just the message, no timestamp
+
+_ors_client = None  # Shared by every dataset processed in this process
+
+def get_ors_client() -> ORSClient:
+    """Create the ORS client once per process so its HTTP connections are reused"""
+    global _ors_client
+    if _ors_client is None:
+        _ors_client = ORSClient()
+    return _ors_client
+
+def init_worker(log_level: int) -> None:
+    """Apply the parent's log level in a worker process, which may have re-imported this module"""
+    logging.getLogger().setLevel(log_level)
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Vehicle Route Optimizer')
-    default_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'all_delivery_data.csv')
+    default_data_path = os.path.join(INPUT_DIR, 'all_delivery_data.csv')
     parser.add_argument('--data', default=default_data_path,
                       help='Path to delivery data CSV file')
     parser.add_argument('--debug', action='store_true',
                       help='Enable debug logging')
+    parser.add_argument('--gzip-maps', action='store_true',
+                      help='Write route maps as gzip-compressed .html.gz files')
     return parser.parse_args()
 
 def list_data_files():
     """List and enumerate data files with letters"""
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    data_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
+    data_files = [f for f in os.listdir(INPUT_DIR) if f.endswith('.csv')]
     data_files.sort()
     
     file_map = {letter: filename for letter, filename in zip(string.ascii_uppercase, data_files)}
@@ -63,23 +82,66 @@ def get_user_selection(file_map):
             
         return letters
 
-def process_dataset(filepath):
+def format_clock(start_time: datetime, minutes: np.ndarray) -> list:
+    """Format start_time plus each offset in minutes as 'HH:MM'"""
+    clock = np.datetime64(start_time, 'us') + np.round(minutes * 60e6).astype('timedelta64[us]')
+    # datetime_as_string gives 'YYYY-MM-DDTHH:MM'
+    return [t[-5:] for t in np.datetime_as_string(clock, unit='m').tolist()]
+
+def schedule_zones(route_table: pd.DataFrame, start_time: datetime) -> dict:
+    """
+    Split the optimized route into zones with running totals, arrival times and the return to hub
+    Args:
+        route_table: RouteOptimizer.route_table, one row per stop in visit order
+        start_time: Departure time from the hub
+    Returns:
+        dict: Zone to its stop dicts in visit order; zones keep first-seen order
+    """
+    # Per-zone running totals computed column-wise on the optimizer's route table
+    table = route_table.copy()
+    by_zone = table.groupby('zone', sort=False)
+    service_time = 4  # Changed from 6 to 4 minutes per stop
+    elapsed_minutes = ((table['distance'] / 1000) * (60 / 30) + service_time).groupby(table['zone'], sort=False).cumsum()
+    
+    table['stop_number'] = by_zone.cumcount() + 1
+    table['total_distance'] = by_zone['distance'].cumsum()
+    table['remaining_stops'] = by_zone.cumcount(ascending=False)
+    table['arrival_time'] = format_clock(start_time, elapsed_minutes.to_numpy())
+    
+    # For last stop, calculate return but don't add to total_distance;
+    # the matrix already holds the routed distance, so no directions request is needed
+    last_stops = table[~table['zone'].duplicated(keep='last')]
+    return_distances = last_stops['distance_to_hub'].to_numpy()
+    # Final time includes the return journey
+    return_minutes = elapsed_minutes[last_stops.index].to_numpy() + (return_distances / 1000) * (60 / 30)
+    # Keyed by zone: last rows are in last-seen order, which differs from the
+    # first-seen zone order when zones interleave along the tour
+    returns = dict(zip(last_stops['zone'], zip(return_distances.tolist(), format_clock(start_time, return_minutes))))
+    
+    # Group by zone; zones keep first-seen order
+    zones = {zone: group.to_dict('records') for zone, group in table.groupby('zone', sort=False)}
+    for zone, stops in zones.items():
+        stops[-1]['return_distance'], stops[-1]['return_time'] = returns[zone]
+    return zones
+
+def process_dataset(filepath, compress_maps=False):
     """Process a single dataset"""
+    # Imported here so --help and dataset selection don't pay for Jinja2/OR-Tools
+    from utils.map_visualizer import MapVisualizer
+    from utils.route_validator import RouteValidator
+    
     filename = os.path.basename(filepath)
     
     # Create test log directory and configure logging
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output')
-    test_log_dir = os.path.join(output_dir, 'test_log')
-    os.makedirs(test_log_dir, exist_ok=True)
+    os.makedirs(TEST_LOG_DIR, exist_ok=True)
     
     # Set up file handler with custom formatter
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    log_file = os.path.join(test_log_dir, f'validation_log_{os.path.splitext(filename)[0]}_{timestamp}.txt')
+    log_file = os.path.join(TEST_LOG_DIR, f'validation_log_{os.path.splitext(filename)[0]}_{timestamp}.txt')
     
-    # Create file handler with formatting
-    file_handler = logging.FileHandler(log_file)
-    formatter = logging.Formatter('%(message)s')  # Just the message without timestamp
-    file_handler.setFormatter(formatter)
+    # Create file handler with the shared formatter; the file is only opened on first write
+    file_handler = logging.FileHandler(log_file, delay=True)
+    file_handler.setFormatter(LOG_FORMATTER)
     file_handler.setLevel(logging.INFO)
     
     # Add handler to logger
@@ -88,7 +150,7 @@ def process_dataset(filepath):
     
     try:
         data_loader = DeliveryDataLoader(filepath)
-        ors_client = ORSClient()
+        ors_client = get_ors_client()
         optimizer = RouteOptimizer(data_loader, ors_client)
         route_sequence = optimizer.optimize_route()
         
@@ -100,62 +162,23 @@ def process_dataset(filepath):
         logger.info("-" * 50)
         
         # Add validation with logging
-        validator = RouteValidator(route_sequence, HUB_LOCATION, ors_client, logger)
+        # The optimizer's matrix already covers these stops, so the validator makes no matrix request
+        validator = RouteValidator(route_sequence, HUB_LOCATION, ors_client, logger,
+                                   road_matrix=optimizer.get_route_matrix())
         validation_results = validator.compare_methods()
         
         if not validation_results:  # Check for empty list
             logger.warning("Validation produced no results")
             validation_results = []  # Ensure we have an empty list
         
-        # Group by zone
-        zones = {}
-        for stop in route_sequence:
-            zone = stop['zone']
-            if zone not in zones:
-                zones[zone] = []
-            zones[zone].append(stop)
-        
-        # Process each zone
         start_time = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
-        
-        # Process zones and calculate times
-        for zone, stops in zones.items():
-            total_zone_distance = 0
-            current_time = start_time
-            
-            for i, stop in enumerate(stops, 1):
-                stop['stop_number'] = i
-                total_zone_distance += stop['distance']
-                stop['total_distance'] = total_zone_distance
-                
-                travel_time = (stop['distance'] / 1000) * (60 / 30)  # minutes
-                service_time = 4  # Changed from 6 to 4 minutes per stop
-                
-                current_time += timedelta(minutes=travel_time + service_time)
-                stop['arrival_time'] = current_time.strftime('%H:%M')
-                
-                # For last stop, calculate return but don't add to total_distance
-                if i == len(stops):  # Last stop
-                    return_route = ors_client.get_route_details(
-                        stop['coordinates'],
-                        HUB_LOCATION
-                    )
-                    return_distance = return_route['features'][0]['properties']['segments'][0]['distance']
-                    stop['return_distance'] = return_distance
-                    
-                    # Update final time with return journey
-                    return_time = (return_distance / 1000) * (60 / 30)
-                    current_time += timedelta(minutes=return_time)
-                    stop['return_time'] = current_time.strftime('%H:%M')
-                
-                stop['remaining_stops'] = len(stops) - i
+        zones = schedule_zones(optimizer.route_table, start_time)
         
         # Generate maps using original filename in maps directory
-        maps_dir = os.path.join(output_dir, 'maps')
-        os.makedirs(maps_dir, exist_ok=True)
-        output_file = os.path.join(maps_dir, os.path.splitext(filename)[0] + '.html')
+        os.makedirs(MAPS_DIR, exist_ok=True)
+        output_file = os.path.join(MAPS_DIR, os.path.splitext(filename)[0] + '.html')
         visualizer = MapVisualizer(zones, ors_client)
-        visualizer.generate_map(output_file)
+        visualizer.generate_map(output_file, compress=compress_maps)
         
         return zones, validation_results
         
@@ -164,6 +187,9 @@ def process_dataset(filepath):
         return None, []  # Return empty list for validation_results
         
     finally:
+        # Keep whatever was fetched, even if the dataset failed part-way
+        if _ors_client is not None:
+            _ors_client.flush_cache()
         logger.removeHandler(file_handler)
         file_handler.close()
 
@@ -183,23 +209,23 @@ def create_route_summary(zones: dict, filename: str, validation_results: list) -
         'Total km Traveled': 0
     })
     
-    # Add all stops in order
-    for zone, stops in zones.items():
-        for stop in stops:
-            rows.append({
-                'Stop Number': f"Stop {stop['stop_number']}",
-                'Zone': stop['zone'],
-                'Address': stop['address'],
-                'Longitude': stop['coordinates'][0],
-                'Latitude': stop['coordinates'][1],
-                'Arrival Time': stop['arrival_time'],
-                'Distance from Hub': stop['distance_from_hub']/1000,
-                'Total km Traveled': stop['total_distance']/1000
-            })
+    # Add all stops in order, built column-wise
+    all_stops = [stop for stops in zones.values() for stop in stops]
+    coords = np.array([stop['coordinates'] for stop in all_stops], dtype=np.float64).reshape(-1, 2)
+    stops_df = pd.DataFrame({
+        'Stop Number': [f"Stop {stop['stop_number']}" for stop in all_stops],
+        'Zone': [stop['zone'] for stop in all_stops],
+        'Address': [stop['address'] for stop in all_stops],
+        'Longitude': coords[:, 0],
+        'Latitude': coords[:, 1],
+        'Arrival Time': [stop['arrival_time'] for stop in all_stops],
+        'Distance from Hub': np.fromiter((stop['distance_from_hub'] for stop in all_stops), np.float64, len(all_stops)) / 1000,
+        'Total km Traveled': np.fromiter((stop['total_distance'] for stop in all_stops), np.float64, len(all_stops)) / 1000
+    })
     
     # Add ending point (return to hub)
     last_stop = next(iter(zones.values()))[-1]  # Get last stop
-    rows.append({
+    footer = [{
         'Stop Number': 'Ending Point',
         'Zone': '-',
         'Address': 'SMC Complex Hub',
@@ -208,55 +234,32 @@ def create_route_summary(zones: dict, filename: str, validation_results: list) -
         'Arrival Time': last_stop['return_time'],
         'Distance from Hub': 0,
         'Total km Traveled': (last_stop['total_distance'] + last_stop['return_distance'])/1000
-    })
+    }]
     
     # Add spacing rows
-    rows.append({key: '' for key in rows[0].keys()})
-    rows.append({key: '' for key in rows[0].keys()})
+    columns = list(stops_df.columns)
+    footer.append({key: '' for key in columns})
+    footer.append({key: '' for key in columns})
     
     # Add validation results header
-    rows.append({
-        'Stop Number': '=== ROUTE OPTIMIZATION TEST RESULTS ===',
-        'Zone': '',
-        'Address': '',
-        'Longitude': '',
-        'Latitude': '',
-        'Arrival Time': '',
-        'Distance from Hub': '',
-        'Total km Traveled': ''
-    })
+    footer.append({**{key: '' for key in columns}, 'Stop Number': '=== ROUTE OPTIMIZATION TEST RESULTS ==='})
     
     # Add column headers for test results
-    rows.append({
-        'Stop Number': 'Method',
-        'Zone': 'Distance (km)',
-        'Address': 'Time (min)',
-        'Longitude': 'Stops',
-        'Latitude': 'Avg Time/Stop',
-        'Arrival Time': 'Redundancy',
-        'Distance from Hub': '% from Optimal',
-        'Total km Traveled': ''
-    })
+    footer.append(dict(zip(columns, [
+        'Method', 'Distance (km)', 'Time (min)', 'Stops',
+        'Avg Time/Stop', 'Redundancy', '% from Optimal', ''
+    ])))
     
-    # Add test results
-    for result in validation_results:
-        rows.append({
-            'Stop Number': result[0],  # Method
-            'Zone': result[1],         # Distance
-            'Address': result[2],      # Time
-            'Longitude': result[3],    # Stops
-            'Latitude': result[4],     # Avg Time/Stop
-            'Arrival Time': result[5], # Redundancy
-            'Distance from Hub': result[6],  # % from Optimal
-            'Total km Traveled': ''
-        })
+    # Add test results: Method, Distance, Time, Stops, Avg Time/Stop, Redundancy, % from Optimal
+    results_df = pd.DataFrame([list(result) + [''] for result in validation_results], columns=columns)
     
-    return pd.DataFrame(rows)
+    return pd.concat([pd.DataFrame(rows), stops_df, pd.DataFrame(footer), results_df], ignore_index=True)
 
 def main():
     args = parse_args()
     if args.debug:
-        logger.setLevel(logging.DEBUG)
+        # Library modules only log; the level is decided here for all of them
+        logging.getLogger().setLevel(logging.DEBUG)
     
     try:
         file_map = list_data_files()
@@ -269,26 +272,33 @@ def main():
             logger.error("No datasets selected")
             sys.exit(1)
         
-        # Process each selected dataset
-        for letter in selected_letters:
-            filename = file_map[letter]
-            filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', filename)
-            
-            logger.info(f"\nProcessing {filename}...")
-            zones, validation_results = process_dataset(filepath)
-            
-            if not zones or not validation_results:
-                logger.error(f"Error processing {filename}")
-                continue
-            
-            # Generate map
-            output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output')
-            maps_dir = os.path.join(output_dir, 'maps')
-            os.makedirs(maps_dir, exist_ok=True)
-            
-            output_file = os.path.join(maps_dir, os.path.splitext(filename)[0] + '.html')
-            visualizer = MapVisualizer(zones, ORSClient())
-            visualizer.generate_map(output_file)
+        max_workers = min(len(selected_letters), os.cpu_count() or 1)
+        if max_workers == 1:
+            # A pool would only add process start-up for a single dataset
+            for letter in selected_letters:
+                filename = file_map[letter]
+                logger.info(f"\nProcessing {filename}...")
+                zones, validation_results = process_dataset(os.path.join(INPUT_DIR, filename), args.gzip_maps)
+                
+                if not zones or not validation_results:
+                    logger.error(f"Error processing {filename}")
+        else:
+            # Datasets are independent, so process them in parallel worker processes;
+            # workers may be spawned rather than forked, so they get the log level explicitly
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                     initargs=(logging.getLogger().level,)) as executor:
+                futures = {}
+                for letter in selected_letters:
+                    filename = file_map[letter]
+                    logger.info(f"\nProcessing {filename}...")
+                    future = executor.submit(process_dataset, os.path.join(INPUT_DIR, filename), args.gzip_maps)
+                    futures[future] = filename
+                
+                for future in as_completed(futures):
+                    zones, validation_results = future.result()
+                    
+                    if not zones or not validation_results:
+                        logger.error(f"Error processing {futures[future]}")
             
         logger.info("\nAll datasets processed successfully!")
         
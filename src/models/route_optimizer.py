@@ -1,10 +1,8 @@
 import numpy as np
-from typing import List, Tuple, Dict
+import pandas as pd
+from typing import List, Dict
 import logging
-import os, sys
-
-project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-sys.path.append(project_root)
+from openrouteservice.exceptions import ApiError
 
 from config import (
     HUB_LOCATION, 
@@ -12,25 +10,98 @@ from config import (
     IDLE_TIME_PER_HOUSE
 )
 
-# Hub location coordinates (longitude, latitude)
-HUB_LOCATION = (125.61986151071888, 7.070884126747574)  # SMC Complex Hub
+logger = logging.getLogger(__name__)
+
+def _tour_prefix_costs(D: np.ndarray, tour: np.ndarray):
+    """Prefix sums of forward and backward edge costs along a closed tour"""
+    fwd = np.concatenate(([0.0], np.cumsum(D[tour[:-1], tour[1:]])))
+    bwd = np.concatenate(([0.0], np.cumsum(D[tour[1:], tour[:-1]])))
+    return fwd, bwd
 
-# Output map filename
-OUTPUT_MAP = 'route_map.html'
+def two_opt(seq: List[int], D: np.ndarray, max_passes: int = 100) -> List[int]:
+    """
+    Improve a hub-anchored tour with 2-opt moves until a full pass finds none
+    Args:
+        seq: Visit order starting at the hub (index 0)
+        D: Distance matrix in meters, may be asymmetric; unroutable pairs hold
+           the float32 max sentinel or NaN
+        max_passes: Upper bound on full passes over the tour
+    Returns:
+        List[int]: Improved visit order, still starting at the hub
+    """
+    D = np.array(D, dtype=np.float64)
+    # Unroutable pairs cost more than any tour of routable legs but stay finite,
+    # so ordinary leg costs keep their precision in the prefix sums below
+    unroutable = ~(D < np.finfo(np.float32).max)
+    if unroutable.any():
+        routable = D[~unroutable]
+        D[unroutable] = (routable.max() if routable.size else 1.0) * len(D) + 1.0
 
-logger = logging.getLogger(__name__)
+    tour = np.array(list(seq) + [0])  # Close the tour back at the hub
+    n = len(tour)
+
+    for _ in range(max_passes):
+        improved = False
+        # Forward and backward prefix sums make the cost of traversing a
+        # reversed segment exact on one-way streets
+        fwd, bwd = _tour_prefix_costs(D, tour)
+
+        for i in range(1, n - 2):
+            a, b = tour[i - 1], tour[i]
+            js = np.arange(i + 1, n - 1)
+            c, d = tour[js], tour[js + 1]
+            delta = (D[a, c] + D[b, d] - D[a, b] - D[c, d]
+                     + (bwd[js] - bwd[i]) - (fwd[js] - fwd[i]))
+
+            k = int(delta.argmin())
+            if delta[k] < -1e-6:
+                j = js[k]
+                tour[i:j + 1] = tour[i:j + 1][::-1]
+                fwd, bwd = _tour_prefix_costs(D, tour)
+                improved = True
+
+        if not improved:
+            return tour[:-1].tolist()
+
+    logger.warning("2-opt stopped after %d passes with improving moves left", max_passes)
+    return tour[:-1].tolist()
+
+def nearest_neighbor_tour(D: np.ndarray) -> List[int]:
+    """
+    Build a greedy tour from the hub by always moving to the closest unvisited point
+    Args:
+        D: Distance matrix in meters, hub at index 0
+    Returns:
+        List[int]: Visit order starting at the hub
+    """
+    visited = np.zeros(len(D), dtype=bool)
+    visited[0] = True
+    seq = [0]
+    current = 0
+
+    for _ in range(len(D) - 1):
+        current = int(np.where(visited, np.inf, D[current]).argmin())
+        visited[current] = True
+        seq.append(current)
+
+    return seq
+
+def nn_then_2opt(D: np.ndarray) -> np.ndarray:
+    """Nearest-neighbor construction followed by 2-opt improvement"""
+    return np.asarray(two_opt(nearest_neighbor_tour(D), D))
 
 class RouteOptimizer:
     def __init__(self, data_loader, ors_client):
         self.data_loader = data_loader
         self.ors_client = ors_client
-        self.delivery_points = self.data_loader.get_coordinates()
-        self.all_coordinates = [HUB_LOCATION] + self.delivery_points
+        delivery_points = self.data_loader.get_coordinates()
+        # Hub first, then delivery points, as one contiguous float64 block
+        self.all_coordinates = np.vstack([np.asarray(HUB_LOCATION, dtype=np.float64), delivery_points])
         self.customer_data = self.data_loader.get_customer_info()
-        self.total_stops = len(self.delivery_points)
-        self.visited = {0}  # Hub is already visited
-        self.current_location = 0  # Start at hub
-        self.distance_matrix = None
+        self.total_stops = len(delivery_points)
+        self.route_table = None  # Columnar view of the last optimized route
+        self.D = None  # Distance matrix in meters as float32 ndarray, hub at index 0
+        self.sequence = None  # Visit order of the last optimized route, hub first, as indices into D
 
     def meters_to_km(self, meters: float) -> float:
         """Convert meters to kilometers"""
@@ -40,91 +111,101 @@ class RouteOptimizer:
         """
         Calculate ETA in minutes based on distance and configuration
         Args:
-            distance_km: Distance in kilometers
+            distance_km: Distance in kilometers, scalar or array of legs
         Returns:
-            float: Estimated time in minutes
+            float: Estimated time in minutes (array when given an array)
         """
-        travel_time = (distance_km / AVG_SPEED_KMH) * 60  # Convert hours to minutes
-        return travel_time + IDLE_TIME_PER_HOUSE
-
-    def find_nearest_point(self) -> int:
-        min_distance = float('inf')
-        nearest_idx = -1
-
-        current_coords = self.all_coordinates[self.current_location]
-        
-        for idx in range(len(self.all_coordinates)):
-            if idx not in self.visited:
-                # Get actual route distance
-                distance = self.get_route_distance(self.current_location, idx)
-                distance_km = self.meters_to_km(distance)
-                
-                logger.debug(f"Point {idx} - Distance: {distance_km:.2f}km")
-                
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_idx = idx
-                    
-        if nearest_idx == -1:
-            raise ValueError("No unvisited points found")
-            
-        return nearest_idx
+        return distance_km * (60.0 / AVG_SPEED_KMH) + IDLE_TIME_PER_HOUSE
 
     def get_route_distance(self, start_idx: int, end_idx: int) -> float:
-        """Get actual road distance between two points in meters"""
+        """
+        Get actual road distance between two points in meters, from the matrix when known
+        Args:
+            start_idx: Index into all_coordinates (hub is 0)
+            end_idx: Index into all_coordinates
+        Returns:
+            float: Distance in meters; pairs the matrix marks unroutable are requested as a single leg
+        Raises:
+            ValueError: ORS finds no road route between the points
+        """
+        if self.D is not None:
+            distance = self.D[start_idx, end_idx]
+            # Unroutable pairs hold the float32 max sentinel
+            if distance < np.finfo(np.float32).max:
+                return float(distance)
+        
         try:
             route = self.ors_client.get_route_details(
                 self.all_coordinates[start_idx],
                 self.all_coordinates[end_idx]
             )
-            return route['features'][0]['properties']['segments'][0]['distance']
-        except Exception as e:
+        except ApiError as e:
+            # ORS answers 404 when no road route joins the points; other failures are not about the leg
+            if e.status != 404:
+                raise
             logger.error(f"Failed to get route distance: {e}")
-            return self.distance_matrix[start_idx][end_idx]
+            raise ValueError(f"No road route from point {start_idx} to point {end_idx}: {e}") from e
+        return route['features'][0]['properties']['segments'][0]['distance']
+
+    def get_route_distances(self, start_idx, end_idx) -> np.ndarray:
+        """
+        Road distances in meters for many (start, end) index pairs
+        Args:
+            start_idx: Start indices, array or scalar
+            end_idx: End indices, array or scalar
+        Returns:
+            np.ndarray: float64 distances; pairs the matrix marks unroutable are requested individually
+        """
+        start_idx, end_idx = np.broadcast_arrays(start_idx, end_idx)
+        distances = self.D[start_idx, end_idx].astype(np.float64)
+        for k in np.flatnonzero(~(distances < np.finfo(np.float32).max)):
+            distances[k] = self.get_route_distance(int(start_idx[k]), int(end_idx[k]))
+        return distances
+
+    def get_route_matrix(self) -> np.ndarray:
+        """Road distances in meters between the hub (index 0) and the stops in visit order, NaN where unroutable"""
+        matrix = self.D[np.ix_(self.sequence, self.sequence)].astype(np.float64)
+        matrix[~(matrix < np.finfo(np.float32).max)] = np.nan
+        return matrix
 
     def optimize_route(self) -> List[Dict]:
         try:
             logger.info("Getting distance matrix...")
-            self.distance_matrix = self.ors_client.get_distance_matrix(self.all_coordinates)
-            route_info = []
-            total_distance = 0
+            # Row-major, so the D[current] scans in the tour loops are plain views
+            self.D = np.ascontiguousarray(self.ors_client.get_distance_matrix(self.all_coordinates), dtype=np.float32)
+            # Unroutable pairs come back as null; keep them selectable but last
+            self.D[~np.isfinite(self.D)] = np.finfo(np.float32).max
+            
+            seq = nn_then_2opt(self.D)
+            self.sequence = seq
+            stops = seq[1:]
+            
+            # Build the route column-wise: one gather per numeric column, with
+            # unroutable matrix cells resolved so no sentinel reaches the output
+            legs = self.get_route_distances(seq[:-1], stops)
+            customers = self.customer_data.iloc[stops - 1]
+            remaining = np.arange(len(stops) - 1, -1, -1)
+            etas = self.calculate_eta(self.meters_to_km(legs))
             
-            self.current_location = 0
-            self.visited = {0}
+            self.route_table = pd.DataFrame({
+                'stop_number': np.arange(1, len(stops) + 1),
+                'tracking_num': customers['tracking_num'].to_numpy(),
+                'zone': customers['zone'].to_numpy(),
+                'address': customers['customer_address'].to_numpy(),
+                'coordinates': list(map(tuple, self.all_coordinates[stops].tolist())),
+                'last_location': list(map(tuple, self.all_coordinates[seq[:-1]].tolist())),
+                'distance': legs,
+                'distance_from_hub': self.get_route_distances(0, stops),
+                'distance_to_hub': self.get_route_distances(stops, 0),  # Road distance back, for return legs
+                'eta': etas,
+                'cumulative_eta': etas.cumsum(),
+                'remaining_stops': remaining,
+                'remaining_parcels': remaining
+            })
+            total_distance = legs.sum()
             
-            while len(self.visited) < len(self.all_coordinates):
-                next_idx = self.find_nearest_point()
-                self.visited.add(next_idx)
-                
-                # Calculate distances
-                current_distance = self.get_route_distance(self.current_location, next_idx)
-                hub_distance = self.get_route_distance(0, next_idx)
-                total_distance += current_distance
-                
-                # Log only every 10th point or first/last point
-                if len(self.visited) % 10 == 0 or len(self.visited) == len(self.all_coordinates):
-                    logger.debug(f"Progress: {len(self.visited)}/{len(self.all_coordinates)} stops")
-                    logger.debug(f"Total distance so far: {total_distance/1000:.2f}km")
-                
-                stop_info = {
-                    'stop_number': len(self.visited) - 1,
-                    'tracking_num': self.customer_data.iloc[next_idx - 1]['tracking_num'],
-                    'zone': self.customer_data.iloc[next_idx - 1]['zone'],
-                    'address': self.customer_data.iloc[next_idx - 1]['customer_address'],
-                    'coordinates': self.all_coordinates[next_idx],
-                    'last_location': self.all_coordinates[self.current_location],
-                    'distance': current_distance,
-                    'distance_from_hub': hub_distance,
-                    'eta': self.calculate_eta(current_distance),
-                    'remaining_stops': len(self.all_coordinates) - len(self.visited),
-                    'remaining_parcels': len(self.all_coordinates) - len(self.visited)
-                }
-                
-                route_info.append(stop_info)
-                self.current_location = next_idx
-                
             logger.info(f"Route optimization complete. Total distance: {total_distance/1000:.2f}km")
-            return route_info
+            return self.route_table.to_dict('records')
             
         except Exception as e:
             logger.error(f"Route optimization failed: {str(e)}")
@@ -1,22 +1,22 @@
+import numpy as np
 import pandas as pd
-from typing import List, Tuple
-import sys
-import os
+from functools import cached_property
 import logging
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from config import DATA_DIR
 # Configure logger
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Only these columns are parsed; customer_id is an older name for tracking_num
+USED_COLUMNS = {'customer_id', 'tracking_num', 'zone', 'customer_address', 'longitude', 'latitude'}
+TEXT_COLUMNS = {'customer_id': str, 'tracking_num': str, 'zone': str, 'customer_address': str}
+
 class DeliveryDataLoader:
     def __init__(self, filepath: str):
         try:
-            self.data = pd.read_csv(filepath)
+            self.data = pd.read_csv(filepath, usecols=lambda col: col in USED_COLUMNS, dtype=TEXT_COLUMNS)
             self.preprocess_data()
             self.validate_data()
-            logger.debug(f"Loaded {len(self.data)} delivery points")
+            logger.debug("Loaded %d delivery points", len(self.data))
         except Exception as e:
             logger.error(f"Failed to load data: {e}")
             raise
@@ -26,17 +26,17 @@ class DeliveryDataLoader:
         # Log initial count
         initial_count = len(self.data)
         
+        # Coerce coordinates column-wise so stray text becomes NaN instead of failing later
+        coord_cols = ['longitude', 'latitude']
+        self.data[coord_cols] = self.data[coord_cols].apply(pd.to_numeric, errors='coerce')
+        
         # Drop rows with NaN coordinates
-        self.data = self.data.dropna(subset=['longitude', 'latitude'])
+        self.data = self.data.dropna(subset=coord_cols)
         cleaned_count = len(self.data)
         
         if initial_count != cleaned_count:
             logger.warning(f"Removed {initial_count - cleaned_count} rows with invalid coordinates")
         
-        # Drop only unnecessary columns
-        columns_to_drop = ['date_of_delivery', 'barangay', 'reason']
-        self.data = self.data.drop(columns=[col for col in columns_to_drop if col in self.data.columns])
-        
         # Rename columns if needed
         if 'customer_id' in self.data.columns:
             self.data = self.data.rename(columns={'customer_id': 'tracking_num'})
@@ -60,14 +60,14 @@ class DeliveryDataLoader:
         # Check if coordinates need to be swapped
         if lon_range['min'] < 100:  # Longitude in Philippines should be > 100
             logger.info("Swapping latitude and longitude columns")
-            self.data['longitude'], self.data['latitude'] = self.data['latitude'], self.data['longitude']
+            self.data = self.data.rename(columns={'longitude': 'latitude', 'latitude': 'longitude'})
             
             # Recalculate ranges after swap
             lon_range = self.data['longitude'].agg(['min', 'max'])
             lat_range = self.data['latitude'].agg(['min', 'max'])
             
-        logger.debug(f"Longitude range: {lon_range['min']:.4f} to {lon_range['max']:.4f}")
-        logger.debug(f"Latitude range: {lat_range['min']:.4f} to {lat_range['max']:.4f}")
+        logger.debug("Longitude range: %.4f to %.4f", lon_range['min'], lon_range['max'])
+        logger.debug("Latitude range: %.4f to %.4f", lat_range['min'], lat_range['max'])
         
         # Validate coordinate ranges for Davao City
         if not (125.0 <= lon_range['min'] <= lon_range['max'] <= 126.0):
@@ -75,10 +75,20 @@ class DeliveryDataLoader:
         if not (6.5 <= lat_range['min'] <= lat_range['max'] <= 7.5):
             raise ValueError(f"Latitude values outside Davao City bounds: {lat_range['min']:.4f} to {lat_range['max']:.4f}")
 
-    def get_coordinates(self) -> List[Tuple[float, float]]:
-        """Extract delivery point coordinates as (longitude, latitude) tuples"""
-        return list(zip(self.data['longitude'], self.data['latitude']))
+    @cached_property
+    def coordinates(self) -> np.ndarray:
+        """Delivery point coordinates as an (N, 2) array of (longitude, latitude), built once"""
+        return self.data[['longitude', 'latitude']].to_numpy(dtype=np.float64)
+
+    @cached_property
+    def customer_info(self) -> pd.DataFrame:
+        """Customer columns, sliced once"""
+        return self.data[['tracking_num', 'zone', 'customer_address']]
+
+    def get_coordinates(self) -> np.ndarray:
+        """Extract delivery point coordinates as an (N, 2) array of (longitude, latitude)"""
+        return self.coordinates
     
     def get_customer_info(self) -> pd.DataFrame:
         """Get customer information including zone and address"""
-        return self.data[['tracking_num', 'zone', 'customer_address']]
\ No newline at end of file
+        return self.customer_info
\ No newline at end of file
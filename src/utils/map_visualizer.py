@@ -1,93 +1,199 @@
-import folium
-from typing import Dict, List
+import gzip
+import json
+import math
+from itertools import chain
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import Environment, FileSystemLoader
+from typing import Dict, List, Optional, Tuple
 import logging
-import sys
-import os
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from config import HUB_LOCATION, OUTPUT_MAP
+try:
+    import orjson  # Optional, several times faster on coordinate-heavy GeoJSON
+except ImportError:
+    orjson = None
+
+from config import HUB_LOCATION, ORS_MAX_WORKERS, ROUTE_SIMPLIFY_TOLERANCE, MAP_COORD_DECIMALS, TEMPLATE_DIR
 
 logger = logging.getLogger(__name__)
 
+# Output is a script payload, not HTML text, so autoescaping stays off
+template_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=False)
+
+def simplify_line(coords: List[List[float]], tolerance: float) -> List[List[float]]:
+    """
+    Simplify a polyline with Ramer-Douglas-Peucker
+    Args:
+        coords: Line vertices as [lon, lat] pairs
+        tolerance: Largest allowed deviation from the original line, in degrees
+    Returns:
+        List[List[float]]: Kept vertices rounded to MAP_COORD_DECIMALS, always including both endpoints
+    """
+    points = np.asarray(coords, dtype=np.float64)
+    if len(points) < 3:
+        return points.round(MAP_COORD_DECIMALS).tolist()
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        dx, dy = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            # Perpendicular distance of every inner vertex to the start-end chord
+            distances = np.abs(dx * offsets[:, 1] - dy * offsets[:, 0]) / length
+        k = int(distances.argmax())
+        if distances[k] > tolerance:
+            split = start + 1 + k
+            keep[split] = True
+            spans.extend([(start, split), (split, end)])
+
+    return points[keep].round(MAP_COORD_DECIMALS).tolist()
+
+def simplify_route(route: Dict, properties: Optional[Dict] = None,
+                   tolerance: float = ROUTE_SIMPLIFY_TOLERANCE) -> List[Dict]:
+    """Draw-only copy of a GeoJSON route's features with simplified lines, ORS properties replaced"""
+    features = []
+    for feature in route['features']:
+        geometry = feature['geometry']
+        if geometry['type'] == 'LineString':
+            geometry = {'type': 'LineString', 'coordinates': simplify_line(geometry['coordinates'], tolerance)}
+        features.append({'type': 'Feature', 'geometry': geometry, 'properties': dict(properties or {})})
+    return features
+
+def _dumps(obj) -> str:
+    """Serialize with orjson when installed, otherwise with the stdlib encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj)
+
+def iter_payload(data, depth: int = 3):
+    """
+    Encode the map payload as JSON chunks, so large payloads are streamed rather than built
+    Args:
+        data: Payload of dicts and lists
+        depth: Nesting levels walked here; anything deeper (e.g. one route feature) is one chunk
+    """
+    if depth and isinstance(data, dict):
+        yield '{'
+        for i, (key, value) in enumerate(data.items()):
+            yield (',' if i else '') + _dumps(key) + ':'
+            yield from iter_payload(value, depth - 1)
+        yield '}'
+    elif depth and isinstance(data, list):
+        yield '['
+        for i, item in enumerate(data):
+            if i:
+                yield ','
+            yield from iter_payload(item, depth - 1)
+        yield ']'
+    else:
+        # Escape "</" so tooltip HTML cannot close the surrounding <script> tag;
+        # every chunk is a complete JSON value, so the pair never straddles two
+        yield _dumps(data).replace('</', '<\\/')
+
 class MapVisualizer:
+    # Route line styles, looked up by each feature's 'kind' property
+    ROUTE_STYLES = {
+        'first': {'color': 'red', 'weight': 3, 'opacity': 0.8},  # Hub to first stop
+        'leg': {'color': 'blue', 'weight': 2, 'opacity': 0.6},
+        'return': {'color': 'red', 'weight': 3, 'opacity': 0.8, 'dashArray': '10,10'}  # Dashed line
+    }
+
     def __init__(self, zones: Dict[str, List[Dict]], ors_client):
         self.zones = zones
         self.ors_client = ors_client
+        # (N, 2) [lon, lat] of every stop, zone by zone in drawing order
+        n_stops = sum(len(stops) for stops in zones.values())
+        self._coords = np.fromiter(
+            (c for stops in zones.values() for stop in stops for c in stop['coordinates']),
+            dtype=np.float64,
+            count=2 * n_stops
+        ).reshape(-1, 2)
+
+    def get_map_center(self) -> Tuple[float, float]:
+        """Center of the delivery points as (latitude, longitude)"""
+        center_lon, center_lat = self._coords.mean(axis=0)
+        return float(center_lat), float(center_lon)
+
+    def fetch_zone_routes(self) -> Dict[str, List[Optional[Dict]]]:
+        """
+        Fetch every route leg of every zone before any drawing happens
+        Returns:
+            Dict mapping zone to [hub->first, stop->stop..., last->hub] GeoJSON routes
+        """
+        zone_points = {
+            zone: [HUB_LOCATION] + [stop['coordinates'] for stop in stops] + [HUB_LOCATION]
+            for zone, stops in self.zones.items() if stops
+        }
+
+        # One multi-waypoint request per zone, with zones fetched concurrently
+        with ThreadPoolExecutor(max_workers=ORS_MAX_WORKERS) as executor:
+            routes = dict(zip(zone_points, executor.map(self._fetch_zone_legs, zone_points.values())))
+
+        # Failed zones fall back to per-leg requests only once the zone pool is done,
+        # so no more than ORS_MAX_WORKERS requests share the connection pool at a time
+        for zone, legs in routes.items():
+            if legs is None:
+                points = zone_points[zone]
+                routes[zone] = self.ors_client.get_routes_batch(list(zip(points[:-1], points[1:])))
 
-    def create_base_map(self, stops: List[Dict]) -> folium.Map:
-        """Create base map centered on delivery points"""
-        center_lat = sum(stop['coordinates'][1] for stop in stops) / len(stops)
-        center_lon = sum(stop['coordinates'][0] for stop in stops) / len(stops)
-        return folium.Map(location=[center_lat, center_lon], zoom_start=14)
+        return {zone: routes.get(zone, []) for zone in self.zones}
 
-    def draw_routes(self, map_obj: folium.Map, stops: List[Dict]):
-        """Draw routes between consecutive stops and from hub to first stop"""
+    def _fetch_zone_legs(self, points: List) -> Optional[List[Dict]]:
+        """Fetch a zone's legs in one request, None if it failed"""
         try:
-            # Draw route from hub to first stop
-            if stops:
-                first_route = self.ors_client.get_route_details(HUB_LOCATION, stops[0]['coordinates'])
-                folium.GeoJson(
-                    first_route,
-                    style_function=lambda x: {
-                        'color': 'red',
-                        'weight': 3,
-                        'opacity': 0.8
-                    }
-                ).add_to(map_obj)
-
-            # Draw routes between consecutive stops
-            for i in range(len(stops) - 1):
-                current_stop = stops[i]
-                next_stop = stops[i + 1]
-                route = self.ors_client.get_route_details(
-                    current_stop['coordinates'],
-                    next_stop['coordinates']
-                )
-                folium.GeoJson(
-                    route,
-                    style_function=lambda x: {
-                        'color': 'blue',
-                        'weight': 2,
-                        'opacity': 0.6
-                    }
-                ).add_to(map_obj)
+            return self.ors_client.get_route_multi(points)
         except Exception as e:
-            logger.error(f"Failed to draw routes: {e}")
+            logger.error(f"Multi-waypoint route failed, fetching legs individually: {e}")
+            return None
+
+    def draw_routes(self, routes: List[Optional[Dict]]) -> List[Dict]:
+        """Build route features for hub to first stop and between consecutive stops"""
+        features = []
+        for i, route in enumerate(routes):
+            if route is None:
+                continue
+            kind = 'first' if i == 0 else 'leg'
+            features.extend(simplify_route(route, {'step': i, 'kind': kind}))
+        return features
 
     def generate_tooltip(self, stop: Dict) -> str:
         """Generate tooltip content for map markers"""
-        return f"""
-            <b>Stop {stop['stop_number']}</b><br>
-            {stop['tracking_num']}<br>
-            Zone: {stop['zone']}<br>
-            Address: {stop['address']}<br>
-            Coordinates: {stop['coordinates']}<br>
-            <br>
-            Distance from Hub: {stop['distance_from_hub']/1000:.2f} km<br>
-            Total Distance: {stop['total_distance']/1000:.2f} km<br>
-            Arrival Time: {stop['arrival_time']}<br>
-            <br>
-            Remaining Stops: {stop['remaining_stops']}
-        """
+        # Adjacent f-strings join at compile time, so no indentation ends up in the payload
+        return (
+            f"<b>Stop {stop['stop_number']}</b><br>"
+            f"{stop['tracking_num']}<br>"
+            f"Zone: {stop['zone']}<br>"
+            f"Address: {stop['address']}<br>"
+            f"Coordinates: {stop['coordinates']}<br>"
+            f"<br>"
+            f"Distance from Hub: {stop['distance_from_hub']/1000:.2f} km<br>"
+            f"Total Distance: {stop['total_distance']/1000:.2f} km<br>"
+            f"Arrival Time: {stop['arrival_time']}<br>"
+            f"<br>"
+            f"Remaining Stops: {stop['remaining_stops']}"
+        )
 
     def generate_hub_tooltip(self, zones: Dict) -> str:
         """Generate enhanced tooltip for hub with complete journey info"""
-        total_journey_distance = 0
-        last_stop = None
-        return_distance = 0
-
-        # Calculate total journey distance including return
-        for zone_stops in zones.values():
-            if zone_stops:
-                # Add all stop-to-stop distances
-                total_journey_distance += sum(stop['distance'] for stop in zone_stops)
-                
-                # Track last stop and return distance
-                if 'return_distance' in zone_stops[-1]:
-                    if not last_stop or zone_stops[-1]['arrival_time'] > last_stop['arrival_time']:
-                        last_stop = zone_stops[-1]
-                        return_distance = last_stop['return_distance']
-                        total_journey_distance += return_distance  # Add return distance to total
+        all_stops = list(chain.from_iterable(zones.values()))
+        total_journey_distance = math.fsum(stop['distance'] for stop in all_stops)
+
+        # The zone that finishes last closes the journey with its return to hub
+        last_stop = max(
+            (zone_stops[-1] for zone_stops in zones.values() if zone_stops and 'return_distance' in zone_stops[-1]),
+            key=lambda stop: stop['arrival_time'],
+            default=None
+        )
+        return_distance = last_stop['return_distance'] if last_stop else 0
+        total_journey_distance += return_distance
 
         if last_stop:
             return f"""
@@ -102,58 +208,72 @@ class MapVisualizer:
         
         return f"<b>SMC Complex Hub</b><br>Coordinates: {HUB_LOCATION}"
 
-    def draw_return_route(self, map_obj: folium.Map, last_stop: Dict):
-        """Draw return route from last stop to hub"""
-        try:
-            return_route = self.ors_client.get_route_details(
-                last_stop['coordinates'],
-                HUB_LOCATION
-            )
-            folium.GeoJson(
-                return_route,
-                style_function=lambda x: {
-                    'color': 'red',
-                    'weight': 3,
-                    'opacity': 0.8,
-                    'dashArray': '10,10'  # Creates dashed line
-                }
-            ).add_to(map_obj)
-        except Exception as e:
-            logger.error(f"Failed to draw return route: {e}")
+    def draw_return_route(self, return_route: Optional[Dict], step: int) -> List[Dict]:
+        """Build the route features for the return from last stop to hub"""
+        if return_route is None:
+            return []
+        return simplify_route(return_route, {'step': step, 'kind': 'return'})
+
+    def _render_zone(self, stops: List[Dict], coords: np.ndarray,
+                     routes: List[Optional[Dict]]) -> Tuple[List[Dict], List[Dict]]:
+        """Build marker and route entries for one zone from its coordinates and pre-fetched routes"""
+        if not stops:
+            return [], []
+
+        markers = [{
+            'lat': lat,
+            'lon': lon,
+            'tooltip': self.generate_tooltip(stop)
+        } for (lon, lat), stop in zip(coords.round(MAP_COORD_DECIMALS).tolist(), stops)]
 
-    def generate_map(self, output_file: str):
-        """Generate and save the route map"""
+        # Routes for this zone, then the return route for its last stop
+        route_entries = self.draw_routes(routes[:-1]) + self.draw_return_route(routes[-1], len(routes) - 1)
+        return markers, route_entries
+
+    def generate_map(self, output_file: str, compress: bool = False):
+        """
+        Generate and save the route map
+        Args:
+            output_file: Path of the HTML file to write
+            compress: Write gzip-compressed HTML to output_file + '.gz' instead
+        """
         try:
-            # Create map with all stops from all zones
-            all_stops = [stop for stops in self.zones.values() for stop in stops]
-            zone_map = self.create_base_map(all_stops)
-            
-            # Add hub marker with enhanced tooltip
-            folium.Marker(
-                location=[HUB_LOCATION[1], HUB_LOCATION[0]],
-                icon=folium.Icon(color='red', icon='info-sign'),
-                tooltip=self.generate_hub_tooltip(self.zones)
-            ).add_to(zone_map)
-            
-            # Process each zone
+            # Fetch all routes first, then build one payload for every zone
+            zone_routes = self.fetch_zone_routes()
+            markers, route_entries = [], []
+            offset = 0
             for zone, stops in self.zones.items():
-                # Draw routes for this zone
-                self.draw_routes(zone_map, stops)
-                
-                # Add markers for each stop
-                for stop in stops:
-                    folium.Marker(
-                        location=[stop['coordinates'][1], stop['coordinates'][0]],
-                        icon=folium.Icon(color='green'),
-                        tooltip=self.generate_tooltip(stop)
-                    ).add_to(zone_map)
-                
-                # Draw return route for last stop in zone
-                if stops:
-                    self.draw_return_route(zone_map, stops[-1])
+                zone_coords = self._coords[offset:offset + len(stops)]
+                offset += len(stops)
+                zone_markers, zone_route_entries = self._render_zone(stops, zone_coords, zone_routes[zone])
+                markers.extend(zone_markers)
+                route_entries.extend(zone_route_entries)
+            
+            payload = {
+                'hub': {
+                    'lat': HUB_LOCATION[1],
+                    'lon': HUB_LOCATION[0],
+                    'tooltip': self.generate_hub_tooltip(self.zones)  # Enhanced hub tooltip
+                },
+                'stops': markers,
+                'routes': {'type': 'FeatureCollection', 'features': route_entries},
+                'styles': self.ROUTE_STYLES
+            }
+            center_lat, center_lon = self.get_map_center()
+            page = template_env.get_template('map.html.j2').stream(
+                payload=iter_payload(payload),
+                center_lat=center_lat,
+                center_lon=center_lon,
+                zoom=14
+            )
             
-            # Save the map
-            zone_map.save(output_file)
+            # Save the map, streaming the page instead of building it as one string
+            if compress:
+                output_file += '.gz'
+                with gzip.open(output_file, 'wt', encoding='utf-8', compresslevel=6) as f:
+                    page.dump(f)
+            else:
+                page.dump(output_file, encoding='utf-8')
             logger.info(f"Generated map: {output_file}")
             
         except Exception as e:
@@ -1,60 +1,125 @@
 import openrouteservice as ors
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 import numpy as np
 import logging
-import sys
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+import json
+import sqlite3
+import zlib
+import threading
 import os
-from time import sleep
 
 # Configure logger
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from config import ORS_API_URL, ORS_PROFILE
+from config import ORS_API_URL, ORS_PROFILE, ORS_MAX_WORKERS, ORS_MAX_WAYPOINTS, ROUTE_CACHE_PATH
+
+class RouteCache:
+    """
+    GeoJSON route cache keyed by profile and rounded (start, end) coordinates, persisted in SQLite.
+    Routes are read from disk on first lookup and new ones written in one transaction on flush,
+    so several processes can share the file.
+    """
+    def __init__(self, path: str = ROUTE_CACHE_PATH, profile: str = ORS_PROFILE):
+        self.path = path
+        self.profile = profile
+        self._routes = {}  # Decoded routes, from disk or fetched this run
+        self._pending = {}
+        self._db = None
+        self._lock = threading.Lock()
+
+    def make_key(self, start: Tuple[float, float], end: Tuple[float, float]) -> str:
+        """Round to ~10cm so the same pair hits the cache regardless of float noise"""
+        # Routes are directed, so start and end are never reordered
+        return f"{self.profile}|{start[0]:.6f},{start[1]:.6f}|{end[0]:.6f},{end[1]:.6f}"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            dirname = os.path.dirname(self.path)
+            if dirname:  # A bare filename lives in the working directory
+                os.makedirs(dirname, exist_ok=True)
+            # Worker threads share the connection; every use is under self._lock
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, route BLOB NOT NULL)")
+        return self._db
+
+    def get(self, start: Tuple[float, float], end: Tuple[float, float]) -> Optional[Dict]:
+        key = self.make_key(start, end)
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                row = self._connect().execute("SELECT route FROM routes WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    route = self._routes[key] = json.loads(zlib.decompress(row[0]))
+            return route
+
+    def put(self, start: Tuple[float, float], end: Tuple[float, float], route: Dict) -> None:
+        key = self.make_key(start, end)
+        with self._lock:
+            self._routes[key] = route
+            self._pending[key] = route
+
+    def flush(self) -> None:
+        """Write routes fetched since the last flush to disk"""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(key, zlib.compress(json.dumps(route).encode())) for key, route in self._pending.items()]
+            db = self._connect()
+            with db:  # One transaction
+                db.executemany("INSERT OR IGNORE INTO routes (key, route) VALUES (?, ?)", rows)
+            logger.debug("Saved %d routes to %s", len(rows), self.path)
+            self._pending = {}
 
 class ORSClient:
     def __init__(self):
-        self.client = ors.Client(base_url="http://localhost:8080/ors")
-        self.profile = "driving-car"
+        self.client = ors.Client(base_url=ORS_API_URL)
+        # One keep-alive connection per concurrent route request; ors.Client already retries
+        # _session is private to openrouteservice, so fall back to its default pool if it goes away
+        session = getattr(self.client, '_session', None)
+        if session is not None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ORS_MAX_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        else:
+            logger.warning("ors.Client has no _session; using its default connection pool")
+        self.profile = ORS_PROFILE
         self.max_batch = 45  # Square root of 2500 minus safety margin
-        self.cache = {}
+        self.route_cache = RouteCache(profile=self.profile)
         
-    def _format_coordinates(self, coordinates: List[Tuple[float, float]]) -> List[List[float]]:
-        """Format coordinates as [longitude, latitude] for ORS API"""
-        return [[lon, lat] for lon, lat in coordinates]
+    def _format_coordinates(self, coordinates) -> List[List[float]]:
+        """Format coordinates (sequence of pairs or (N, 2) array) as [longitude, latitude] for ORS API"""
+        return np.asarray(coordinates, dtype=np.float64).tolist()
     
-    def _validate_coordinates(self, coordinates: List[Tuple[float, float]]) -> bool:
-        """Validate coordinates are within Davao City bounds"""
-        for coord in coordinates:
-            lon, lat = coord
-            logger.debug(f"Validating coordinate: lon={lon}, lat={lat}")
-            # Expanded bounds slightly for safety
-            if not (124.5 <= lon <= 126.5 and 6.0 <= lat <= 8.5):
-                logger.error(f"Invalid coordinate: {coord}")
-                return False
+    def _validate_coordinates(self, coordinates: np.ndarray) -> bool:
+        """Validate (N, 2) [lon, lat] coordinates are within Davao City bounds"""
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        lon, lat = coordinates[:, 0], coordinates[:, 1]
+        # Expanded bounds slightly for safety
+        valid = (lon >= 124.5) & (lon <= 126.5) & (lat >= 6.0) & (lat <= 8.5)
+        if not valid.all():
+            logger.error(f"Invalid coordinates at rows {np.flatnonzero(~valid).tolist()}: {coordinates[~valid].tolist()}")
+            return False
         return True
     
-    def _normalize_coordinates(self, coordinates: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    def _normalize_coordinates(self, coordinates: np.ndarray) -> np.ndarray:
         """Ensure all coordinates are in (lon, lat) format"""
-        normalized = []
-        for lon, lat in coordinates:
-            # If coordinates appear swapped (lat > lon), swap them
-            if lat > lon:
-                lon, lat = lat, lon
-            normalized.append((lon, lat))
-        return normalized
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        # If coordinates appear swapped (lat > lon), swap them
+        swapped = coordinates[:, 1] > coordinates[:, 0]
+        return np.where(swapped[:, None], coordinates[:, ::-1], coordinates)
     
-    def get_distance_matrix(self, coordinates: List[Tuple[float, float]]) -> List[List[float]]:
-        """Calculate distance matrix between all points"""
+    def get_distance_matrix(self, coordinates: List[Tuple[float, float]]) -> np.ndarray:
+        """Calculate distance matrix (meters, float32, NaN where unroutable) between all points"""
         try:
-            logger.debug(f"Input coordinates: {coordinates}")
-            
+            logger.debug("Input coordinates: %d points", len(coordinates))
             if not self._validate_coordinates(coordinates):
-                raise ValueError(f"Coordinates outside Davao City bounds: {coordinates}")
+                raise ValueError("Coordinates outside Davao City bounds")
+            coordinates = self._format_coordinates(coordinates)
                 
             if len(coordinates) <= self.max_batch:
-                return self._request_matrix(coordinates)
+                return np.asarray(self._request_matrix(coordinates), dtype=np.float32)
                 
             return self._process_large_matrix(coordinates)
             
@@ -62,35 +127,45 @@ class ORSClient:
             logger.error(f"Matrix calculation failed: {str(e)}")
             raise Exception(f"Error calculating distance matrix: {str(e)}")
             
-    def _request_matrix(self, coords: List[Tuple[float, float]]) -> List[List[float]]:
+    def _request_matrix(self, coords: List[Tuple[float, float]],
+                        sources: List[int] = None,
+                        destinations: List[int] = None) -> List[List[float]]:
+        """Request road distances (meters) between the given locations"""
         matrix = self.client.distance_matrix(
             locations=coords,
             profile=self.profile,
-            metrics=['duration'],
+            sources=sources,
+            destinations=destinations,
+            metrics=['distance'],
             validate=False
         )
-        return matrix.get('durations', [])
+        return matrix.get('distances', [])
         
-    def _process_large_matrix(self, coordinates: List[Tuple[float, float]]) -> List[List[float]]:
+    def _process_large_matrix(self, coordinates: List[Tuple[float, float]]) -> np.ndarray:
+        """Assemble the full matrix block by block, including cross-batch blocks"""
         n = len(coordinates)
-        result = np.zeros((n, n))
+        result = np.empty((n, n), dtype=np.float32)  # Every block is written below
         
         for i in range(0, n, self.max_batch):
-            batch = coordinates[i:min(i + self.max_batch, n)]
-            sub_matrix = self._request_matrix(batch)
-            result[i:i + len(batch), i:i + len(batch)] = sub_matrix
+            row_batch = coordinates[i:min(i + self.max_batch, n)]
+            for j in range(0, n, self.max_batch):
+                col_batch = coordinates[j:min(j + self.max_batch, n)]
+                if i == j:
+                    sub_matrix = self._request_matrix(row_batch)
+                else:
+                    sub_matrix = self._request_matrix(
+                        row_batch + col_batch,
+                        sources=list(range(len(row_batch))),
+                        destinations=list(range(len(row_batch), len(row_batch) + len(col_batch)))
+                    )
+                result[i:i + len(row_batch), j:j + len(col_batch)] = np.asarray(sub_matrix, dtype=np.float32)
             
-        return result.tolist()
+        return result
             
     def get_route(self, start: Tuple[float, float], end: Tuple[float, float]) -> Dict:
         """Get detailed route between two points"""
         try:
-            route = self.client.directions(
-                coordinates=[start, end],
-                profile=self.profile,
-                format='geojson'
-            )
-            return route
+            return self.get_route_details(start, end)
         except Exception as e:
             raise Exception(f"Error getting route: {str(e)}")
             
@@ -103,26 +178,92 @@ class ORSClient:
             
     def get_route_details(self, start: Tuple[float, float], end: Tuple[float, float]) -> Dict:
         """Get route details with caching"""
-        cache_key = f"{start}_{end}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        route = self.route_cache.get(start, end)
+        if route is not None:
+            return route
             
         route = self.client.directions(
-            coordinates=[start, end],
-            profile="driving-car",
+            coordinates=self._format_coordinates([start, end]),  # Plain lists, callers may pass ndarray rows
+            profile=self.profile,
             format='geojson'
         )
-        self.cache[cache_key] = route
+        self.route_cache.put(start, end, route)
         return route
 
-    def get_route_distance(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
-        """Get actual road distance between two points"""
-        try:
+    def _split_legs(self, route: Dict) -> List[Dict]:
+        """Split a multi-waypoint directions response into one single-leg route per segment"""
+        feature = route['features'][0]
+        coords = feature['geometry']['coordinates']
+        way_points = feature['properties']['way_points']
+        return [{
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': coords[start:end + 1]},
+                'properties': {'segments': [segment], 'way_points': [0, end - start]}
+            }]
+        } for start, end, segment in zip(way_points[:-1], way_points[1:], feature['properties']['segments'])]
+
+    def get_route_multi(self, coordinates: List[Tuple[float, float]]) -> List[Dict]:
+        """
+        Get the legs of an ordered route with one directions request per ORS_MAX_WAYPOINTS points
+        Args:
+            coordinates: Ordered waypoints, e.g. hub, stops..., hub
+        Returns:
+            List of single-leg GeoJSON routes, one per consecutive pair of waypoints
+        """
+        pairs = list(zip(coordinates[:-1], coordinates[1:]))
+        legs = [self.route_cache.get(start, end) for start, end in pairs]
+        if all(leg is not None for leg in legs):
+            return legs
+
+        legs = []
+        # Consecutive chunks share their boundary waypoint so no leg is skipped
+        for i in range(0, len(pairs), ORS_MAX_WAYPOINTS - 1):
+            chunk = self._format_coordinates(coordinates[i:i + ORS_MAX_WAYPOINTS])
             route = self.client.directions(
-                coordinates=[start, end],
+                coordinates=chunk,
                 profile=self.profile,
                 format='geojson'
             )
+            legs.extend(self._split_legs(route))
+        if len(legs) != len(pairs):
+            raise ValueError(f"Directions returned {len(legs)} legs for {len(pairs)} waypoint pairs")
+
+        for (start, end), leg in zip(pairs, legs):
+            self.route_cache.put(start, end, leg)
+        return legs
+
+    def _get_route_or_none(self, pair: Tuple) -> Optional[Dict]:
+        try:
+            return self.get_route_details(*pair)
+        except Exception as e:
+            logger.error(f"Failed to fetch route {pair}: {e}")
+            return None
+
+    def get_routes_batch(self, pairs: List[Tuple]) -> List[Optional[Dict]]:
+        """
+        Get route details for many (start, end) pairs concurrently over the shared session
+        Args:
+            pairs: List of (start, end) coordinate pairs
+        Returns:
+            List of GeoJSON routes in the same order, None where a request failed
+        """
+        with ThreadPoolExecutor(max_workers=ORS_MAX_WORKERS) as executor:
+            return list(executor.map(self._get_route_or_none, pairs))
+
+    def flush_cache(self) -> None:
+        """Persist newly fetched routes"""
+        try:
+            self.route_cache.flush()
+        except Exception as e:
+            # Another process may hold the cache file; the routes are simply refetched next run
+            logger.warning(f"Could not save route cache: {e}")
+
+    def get_route_distance(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
+        """Get actual road distance between two points"""
+        try:
+            route = self.get_route_details(start, end)
             # Distance in kilometers
             return route['features'][0]['properties']['segments'][0]['distance'] / 1000
         except Exception as e:
@@ -1,22 +1,31 @@
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 import numpy as np
-from datetime import datetime, timedelta
-import random
 import math
 import logging
+from functools import cached_property
 from tabulate import tabulate
 
 logger = logging.getLogger(__name__)
 
 class RouteValidator:
-    def __init__(self, stops, hub_location, ors_client, logger):
+    def __init__(self, stops, hub_location, ors_client, logger, road_matrix=None):
         self.stops = stops
         self.hub_location = hub_location
         self.ors_client = ors_client
         self.logger = logger
         self.AVERAGE_SPEED = 30  # km/h
         self.SERVICE_TIME = 4    # minutes
+        # (N + 1, 2) [lon, lat] of the hub (index 0) and every stop, in stop order;
+        # extracted from the stop dicts once and shared by every method
+        self._points = np.vstack([
+            np.asarray(hub_location, dtype=np.float64),
+            np.array([stop['coordinates'] for stop in stops], dtype=np.float64).reshape(-1, 2)
+        ])
+        # Matrix index of each stop, by identity
+        self._stop_index = {id(stop): i for i, stop in enumerate(stops, 1)}
+        # Optional (N + 1, N + 1) road matrix in the same layout, e.g. from the optimizer
+        self._given_road_matrix = road_matrix
 
     def calculate_euclidean_distance(self, point1, point2):
         """Calculate straight-line distance between two points"""
@@ -31,11 +40,13 @@ class RouteValidator:
         c = 2 * math.asin(math.sqrt(a))
         return R * c * 1000  # Convert to meters
 
-    def get_random_route(self):
-        """Generate random route"""
-        random_stops = self.stops.copy()
-        random.shuffle(random_stops)
-        return random_stops
+    @cached_property
+    def road_matrix(self):
+        """Road distances in meters between the hub (index 0) and all stops, fetched once"""
+        given = self._given_road_matrix
+        if given is None:
+            return self.get_distance_matrix(self._points.tolist())
+        return self.fill_unroutable_cells(np.array(given, dtype=np.float64), self._points.tolist())
 
     def get_euclidean_route(self):
         """Generate route based on straight-line distances"""
@@ -55,17 +66,9 @@ class RouteValidator:
 
     def solve_ortools(self):
         """Generate route using OR-Tools"""
-        # Create distance matrix
+        # Shared with calculate_metrics
         size = len(self.stops) + 1
-        matrix = np.zeros((size, size))
-        locations = [self.hub_location] + [stop['coordinates'] for stop in self.stops]
-        
-        for i in range(size):
-            for j in range(size):
-                if i != j:
-                    matrix[i][j] = self.ors_client.get_route_details(
-                        locations[i], locations[j]
-                    )['features'][0]['properties']['segments'][0]['distance']
+        matrix = self.road_matrix
         
         # Set up OR-Tools
         manager = pywrapcp.RoutingIndexManager(size, 1, 0)
@@ -97,47 +100,63 @@ class RouteValidator:
             return ordered_stops
         return None
 
-    def calculate_metrics(self, route):
-        """Calculate total distance and time for a route"""
-        total_distance = 0
-        total_time = 0
-        current = self.hub_location
-        
-        for stop in route:
-            # Calculate distance and time to stop
-            route_details = self.ors_client.get_route_details(current, stop['coordinates'])
-            distance = route_details['features'][0]['properties']['segments'][0]['distance']
-            travel_time = (distance / 1000) * (60 / self.AVERAGE_SPEED)
-            
-            total_distance += distance
-            total_time += travel_time + self.SERVICE_TIME
-            current = stop['coordinates']
+    def get_distance_matrix(self, locations):
+        """Road distances in meters between all locations, from one matrix request when possible"""
+        try:
+            matrix = self.ors_client.get_distance_matrix(locations).astype(np.float64)
+        except Exception as e:
+            self.logger.error(f"Matrix request failed, fetching routes individually: {e}")
+            matrix = np.full((len(locations), len(locations)), np.nan)
+            np.fill_diagonal(matrix, 0.0)
+        return self.fill_unroutable_cells(matrix, locations)
+
+    def fill_unroutable_cells(self, matrix, locations):
+        """Replace NaN or float32-max sentinel cells with single-route distances, keeping every other cell"""
+        rows, cols = np.nonzero(~(matrix < np.finfo(np.float32).max))
+        if len(rows) == 0:
+            return matrix
         
-        # Add return to hub
-        route_details = self.ors_client.get_route_details(current, self.hub_location)
-        return_distance = route_details['features'][0]['properties']['segments'][0]['distance']
-        return_time = (return_distance / 1000) * (60 / self.AVERAGE_SPEED)
+        self.logger.warning(f"Distance matrix has {len(rows)} unroutable pairs, fetching them individually")
+        pairs = list(zip(rows.tolist(), cols.tolist()))
+        routes = self.ors_client.get_routes_batch([(locations[i], locations[j]) for i, j in pairs])
+        matrix[rows, cols] = [self.get_segment_distance(route_details) for route_details in routes]
+        return matrix
+
+    def get_segment_distance(self, route_details):
+        """Distance in meters of a single-leg route, raising if the leg could not be fetched"""
+        if route_details is None:
+            raise ValueError("Route request failed")
+        return route_details['features'][0]['properties']['segments'][0]['distance']
+
+    def route_indices(self, route):
+        """Matrix indices of a route's stops, in visit order"""
+        return np.fromiter((self._stop_index[id(stop)] for stop in route), dtype=np.intp, count=len(route))
+
+    def calculate_metrics(self, route):
+        """Calculate total distance and time for a route, scored on the road matrix"""
+        # Hub, stops in visit order, back to hub
+        idx = np.concatenate(([0], self.route_indices(route), [0]))
+        legs = self.road_matrix[idx[:-1], idx[1:]]
         
-        total_distance += return_distance
-        total_time += return_time
+        total_distance = float(legs.sum())
+        # Travel time for every leg including the return, service time at every stop
+        total_time = total_distance / 1000 * (60 / self.AVERAGE_SPEED) + self.SERVICE_TIME * len(route)
         
         return total_distance, total_time
 
-    def calculate_extended_metrics(self, route, total_distance, total_time):
+    def calculate_extended_metrics(self, route, total_time):
         """Calculate additional validation metrics for a route"""
         num_stops = len(route)
         avg_time_per_stop = total_time / num_stops if num_stops > 0 else 0
         
-        # Calculate route redundancy by checking revisited areas
-        visited_areas = set()
-        redundant_paths = 0
-        
-        # Define area by rounding coordinates to 4 decimal places
-        for stop in route:
-            area = (round(stop['coordinates'][0], 4), round(stop['coordinates'][1], 4))
-            if area in visited_areas:
-                redundant_paths += 1
-            visited_areas.add(area)
+        # Calculate route redundancy by checking revisited areas: an area is the
+        # coordinates rounded to 4 decimal places with Python's round(), as before
+        areas = np.array(
+            [(round(lon, 4), round(lat, 4)) for lon, lat in self._points[self.route_indices(route)].tolist()],
+            dtype=np.float64
+        ).reshape(-1, 2)
+        # Every stop after the first in an area is a revisit
+        redundant_paths = num_stops - len(np.unique(areas, axis=0))
             
         return {
             "num_stops": num_stops,
@@ -158,7 +177,7 @@ class RouteValidator:
             metrics_by_method["Nearest Neighbor"] = {
                 "distance": nn_distance/1000,
                 "time": nn_time,
-                **self.calculate_extended_metrics(nn_route, nn_distance, nn_time)
+                **self.calculate_extended_metrics(nn_route, nn_time)
             }
             
             # Create results array with proper structure
@@ -195,62 +214,60 @@ class RouteValidator:
 
     def get_nearest_neighbor_route_detailed(self):
         """Generate route using Nearest Neighbor algorithm with detailed logging"""
-        unvisited_stops = self.stops.copy()
+        unvisited = np.ones(len(self.stops), dtype=bool)
         route = []
         current_location = self.hub_location
+        current_index = 0  # Road matrix row of the current location
+        # The decision log is O(N^2) lines, so it is only formatted when it will be written
+        detailed = self.logger.isEnabledFor(logging.INFO)
         
         self.logger.info("\nNEAREST NEIGHBOR ALGORITHM - DECISION PROCESS")
         self.logger.info("============================================")
         self.logger.info(f"Starting Point: SMC Complex Hub ({self.hub_location[0]:.4f}, {self.hub_location[1]:.4f})")
         
-        step = 1
-        total_stops = len(unvisited_stops)
+        total_stops = len(self.stops)
         total_distance = 0
         
-        while unvisited_stops:
-            self.logger.info(f"\nITERATION {step}/{total_stops}")
-            self.logger.info("--------------------")
-            self.logger.info(f"Current Position: ({current_location[0]:.4f}, {current_location[1]:.4f})")
+        for step in range(1, total_stops + 1):
+            if detailed:
+                self.logger.info(f"\nITERATION {step}/{total_stops}")
+                self.logger.info("--------------------")
+                self.logger.info(f"Current Position: ({current_location[0]:.4f}, {current_location[1]:.4f})")
+                self.logger.info("\nCANDIDATE STOPS ANALYSIS:")
             
-            # Calculate and sort distances to all remaining stops
-            distances = []
-            self.logger.info("\nCANDIDATE STOPS ANALYSIS:")
+            # Distances to all remaining stops, read from the current point's road matrix row;
+            # stop i is matrix index i + 1
+            candidates = np.flatnonzero(unvisited)
+            distances = self.road_matrix[current_index, candidates + 1]
             
-            # Sort stops by distance for a clearer view of options
-            for stop in unvisited_stops:
-                route_details = self.ors_client.get_route_details(
-                    current_location, 
-                    stop['coordinates']
-                )
-                distance = route_details['features'][0]['properties']['segments'][0]['distance']
-                distances.append({
-                    'stop': stop,
-                    'distance': distance
-                })
+            # Sort stops by distance for a clearer view of options, logged as one message
+            if detailed:
+                ranking = []
+                for rank, k in enumerate(np.argsort(distances, kind='stable'), 1):
+                    stop = self.stops[candidates[k]]
+                    ranking.append(
+                        f"\nRank {rank}:\n"
+                        f"  Original Stop #{stop['stop_number']} - Zone {stop['zone']}\n"
+                        f"  Distance from current: {distances[k]/1000:.2f} km\n"
+                        f"  Address: {stop['address']}"
+                    )
+                self.logger.info("\n".join(ranking))
                 
-            # Sort distances to show all options in order
-            sorted_distances = sorted(distances, key=lambda x: x['distance'])
-            
-            # Show all options with their rankings
-            for rank, option in enumerate(sorted_distances, 1):
-                stop = option['stop']
-                distance = option['distance']
-                self.logger.info(f"\nRank {rank}:")
-                self.logger.info(f"  Original Stop #{stop['stop_number']} - Zone {stop['zone']}")
-                self.logger.info(f"  Distance from current: {distance/1000:.2f} km")
-                self.logger.info(f"  Address: {stop['address']}")
-                
-            # Select nearest stop
-            nearest = sorted_distances[0]
+            # Select nearest stop; argmin keeps the first of equal distances, like the ranking
+            k = int(distances.argmin())
+            nearest = {'stop': self.stops[candidates[k]], 'distance': float(distances[k])}
             total_distance += nearest['distance']
             
-            self.logger.info("\nDECISION")
-            self.logger.info("---------")
-            self.logger.info(f"Selected: Original Stop #{nearest['stop']['stop_number']} (Visit Order: {step})")
-            self.logger.info(f"Reason: Closest stop at {nearest['distance']/1000:.2f} km")
-            self.logger.info(f"Progressive Route Distance: {total_distance/1000:.2f} km")
+            if detailed:
+                self.logger.info("\nDECISION")
+                self.logger.info("---------")
+                self.logger.info(f"Selected: Original Stop #{nearest['stop']['stop_number']} (Visit Order: {step})")
+                self.logger.info(f"Reason: Closest stop at {nearest['distance']/1000:.2f} km")
+                self.logger.info(f"Progressive Route Distance: {total_distance/1000:.2f} km")
             
             route.append(nearest['stop'])
             current_location = nearest['stop']['coordinates']
-            unvisited_stops.remove(nearest['stop'])
-            step += 1
\ No newline at end of file
+            current_index = candidates[k] + 1
+            unvisited[candidates[k]] = False
+        
+        return route
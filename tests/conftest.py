@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+# Modules import each other as top-level packages (config, utils, models), as when run from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.ors_client import ORSClient, RouteCache
+
+
+def point_key(point):
+    return tuple(round(float(c), 6) for c in point)
+
+
+class FakeORSServer(BaseAdapter):
+    """
+    Transport adapter answering matrix and directions requests like a local ORS instance.
+    Requests go through the real openrouteservice client and requests, so bodies are JSON-encoded.
+    """
+    def __init__(self):
+        super().__init__()
+        self.requests = []  # (path, decoded JSON body) of every request
+        self.matrix_gaps = set()  # (start, end) pairs the matrix reports as null
+        self.unroutable = set()  # (start, end) pairs with no road route at all
+        self.error_status = None  # Answer every directions request with this status when set
+        self.matrix_error_status = None  # Same for matrix requests
+
+    def distance(self, start, end):
+        """Meters, asymmetric so one-way handling is exercised"""
+        (x0, y0), (x1, y1) = start, end
+        return round((abs(x1 - x0) + abs(y1 - y0)) * 1e5 + (50.0 if x0 < x1 else 0.0), 1)
+
+    def _no_route(self, start, end):
+        return (point_key(start), point_key(end)) in self.unroutable
+
+    def _matrix(self, body):
+        if self.matrix_error_status is not None:
+            return self.matrix_error_status, {'error': {'code': 6003, 'message': 'Parameter error'}}
+        locations = body['locations']
+        sources = body.get('sources') or range(len(locations))
+        destinations = body.get('destinations') or range(len(locations))
+        rows = []
+        for i in sources:
+            row = []
+            for j in destinations:
+                a, b = locations[i], locations[j]
+                gap = (point_key(a), point_key(b)) in self.matrix_gaps or self._no_route(a, b)
+                row.append(None if gap else (0.0 if i == j else self.distance(a, b)))
+            rows.append(row)
+        return 200, {'distances': rows}
+
+    def _directions(self, body):
+        coords = body['coordinates']
+        if self.error_status is not None:
+            return self.error_status, {'error': {'code': 2003, 'message': 'Parameter error'}}
+        if any(self._no_route(a, b) for a, b in zip(coords[:-1], coords[1:])):
+            return 404, {'error': {'code': 2009, 'message': 'Route could not be found'}}
+        segments = [{'distance': self.distance(a, b), 'duration': 1.0} for a, b in zip(coords[:-1], coords[1:])]
+        return 200, {'type': 'FeatureCollection', 'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': coords},
+            'properties': {'segments': segments, 'way_points': list(range(len(coords)))}
+        }]}
+
+    def send(self, request, **kwargs):
+        body = json.loads(request.body)
+        self.requests.append((request.path_url, body))
+        handler = self._matrix if '/matrix/' in request.path_url else self._directions
+        status, payload = handler(body)
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(payload).encode()
+        response.headers['Content-Type'] = 'application/json'
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+    def count(self, kind):
+        return sum(1 for path, _ in self.requests if f'/{kind}/' in path)
+
+
+@pytest.fixture
+def ors_server():
+    return FakeORSServer()
+
+
+@pytest.fixture
+def ors_client(ors_server, tmp_path):
+    client = ORSClient()
+    client.client._session.mount('http://', ors_server)
+    client.client._session.mount('https://', ors_server)
+    client.route_cache = RouteCache(path=str(tmp_path / 'route_cache.sqlite'))
+    return client
+
+
+@pytest.fixture
+def delivery_csv(tmp_path):
+    """Five stops in two zones around the hub, in the dataset CSV layout"""
+    path = tmp_path / 'deliveries.csv'
+    path.write_text(
+        'tracking_num,zone,customer_address,longitude,latitude\n'
+        'T1,A,Stop 1,125.6100,7.0700\n'
+        'T2,A,Stop 2,125.6150,7.0750\n'
+        'T3,B,Stop 3,125.6250,7.0650\n'
+        'T4,B,Stop 4,125.6300,7.0720\n'
+        'T5,A,Stop 5,125.6050,7.0680\n'
+    )
+    return str(path)
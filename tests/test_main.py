@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from config import HUB_LOCATION
+from conftest import point_key
+from main import format_clock, schedule_zones
+from utils.map_visualizer import MapVisualizer
+
+
+def test_format_clock():
+    start = datetime(2024, 1, 29, 8, 0)
+    minutes = np.array([0.0, 4.0, 90.0, 16 * 60 + 30])
+    assert format_clock(start, minutes) == ['08:00', '08:04', '09:30', '00:30']
+
+
+def test_format_clock_empty():
+    assert format_clock(datetime(2024, 1, 29, 8, 0), np.array([])) == []
+
+
+def route_table(zones, distances, to_hub):
+    return pd.DataFrame({
+        'zone': zones,
+        'distance': np.asarray(distances, dtype=np.float64),
+        'distance_to_hub': np.asarray(to_hub, dtype=np.float64),
+    })
+
+
+def test_schedule_zones_running_totals():
+    table = route_table(['A', 'A', 'A'], [1000, 500, 1500], [1000, 1200, 2000])
+    zones = schedule_zones(table, datetime(2024, 1, 29, 8, 0))
+
+    stops = zones['A']
+    assert [s['stop_number'] for s in stops] == [1, 2, 3]
+    assert [s['total_distance'] for s in stops] == [1000, 1500, 3000]
+    assert [s['remaining_stops'] for s in stops] == [2, 1, 0]
+    # 2 min per km at 30 km/h plus 4 min service per stop
+    assert [s['arrival_time'] for s in stops] == ['08:06', '08:11', '08:18']
+    assert stops[-1]['return_distance'] == 2000
+    assert stops[-1]['return_time'] == '08:22'
+    assert 'return_distance' not in stops[0]
+
+
+def test_schedule_zones_interleaved_zones_get_their_own_return_leg():
+    # Zone A opens and closes the tour with zone B in between, so A is
+    # first-seen first but its last stop comes after B's
+    table = route_table(['A', 'B', 'B', 'A'], [1000, 3000, 1000, 6000], [1000, 3500, 4754, 5184])
+    zones = schedule_zones(table, datetime(2024, 1, 29, 8, 0))
+
+    assert list(zones) == ['A', 'B']
+    a, b = zones['A'], zones['B']
+    assert [s['distance_to_hub'] for s in a] == [1000, 5184]
+    assert a[-1]['return_distance'] == 5184
+    assert b[-1]['return_distance'] == 4754
+    assert a[-1]['arrival_time'] == '08:22'
+    assert a[-1]['return_time'] == '08:32'
+    assert b[-1]['arrival_time'] == '08:16'
+    assert b[-1]['return_time'] == '08:25'
+
+
+def test_schedule_zones_groups_interleaved_stops_for_the_hub_tooltip():
+    table = route_table(['A', 'B', 'B', 'A'], [1000, 3000, 1000, 6000], [1000, 3500, 4754, 5184])
+    table['tracking_num'] = ['T1', 'T2', 'T3', 'T4']
+    table['address'] = ['a1', 'b1', 'b2', 'a2']
+    table['coordinates'] = [(125.60, 7.07), (125.61, 7.07), (125.62, 7.08), (125.63, 7.08)]
+    zones = schedule_zones(table, datetime(2024, 1, 29, 8, 0))
+
+    # Each zone holds its own stops in visit order, with the return leg only on its last stop
+    assert [s['tracking_num'] for s in zones['A']] == ['T1', 'T4']
+    assert [s['tracking_num'] for s in zones['B']] == ['T2', 'T3']
+    assert ['return_distance' in s for s in zones['A'] + zones['B']] == [False, True, False, True]
+
+    # Zone A finishes last, so the hub tooltip reports A's return leg
+    tooltip = MapVisualizer(zones, ors_client=None).generate_hub_tooltip(zones)
+    assert 'Stop #2 - a2' in tooltip
+    assert 'Return to hub distance: 5.18 km' in tooltip
+    assert 'Final return time: 08:32' in tooltip
+
+
+def test_process_dataset_end_to_end(monkeypatch, tmp_path, ors_server, ors_client, delivery_csv):
+    monkeypatch.setattr(main, '_ors_client', ors_client)
+    monkeypatch.setattr(main, 'TEST_LOG_DIR', str(tmp_path / 'test_log'))
+    monkeypatch.setattr(main, 'MAPS_DIR', str(tmp_path / 'maps'))
+    stop = point_key((125.6250, 7.0650))
+    ors_server.matrix_gaps = {(point_key(HUB_LOCATION), stop)}
+
+    zones, validation_results = main.process_dataset(delivery_csv)
+
+    assert sorted(zones) == ['A', 'B']
+    assert sorted(s['tracking_num'] for stops in zones.values() for s in stops) == ['T1', 'T2', 'T3', 'T4', 'T5']
+    for stops in zones.values():
+        assert [s['stop_number'] for s in stops] == list(range(1, len(stops) + 1))
+        assert stops[-1]['return_distance'] == pytest.approx(ors_server.distance(stops[-1]['coordinates'], HUB_LOCATION))
+        assert stops[-1]['return_time'] >= stops[-1]['arrival_time']
+    assert validation_results[0][0] == 'Nearest Neighbor'
+    assert (tmp_path / 'maps' / 'deliveries.html').exists()
+    # Matrix once for the optimizer, the gap as one leg, then one multi-waypoint request per zone
+    assert ors_server.count('matrix') == 1
+    assert ors_server.count('directions') == 3
@@ -0,0 +1,73 @@
+import json
+import threading
+
+import pytest
+
+from conftest import point_key
+from utils import map_visualizer
+from utils.map_visualizer import MapVisualizer, iter_payload, simplify_line
+
+PAYLOAD = {
+    'hub': {'lat': 7.07, 'lon': 125.62, 'tooltip': '<b>Hub</b></script><script>alert(1)</script>'},
+    'stops': [{'lat': 7.071, 'lon': 125.6, 'tooltip': 'Stop </b>'}, {'lat': 7.072, 'lon': 125.61, 'tooltip': ''}],
+    'routes': {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[125.6, 7.07], [125.61, 7.08]]},
+         'properties': {'step': 0, 'kind': 'first'}}
+    ]},
+    'styles': {'leg': {'color': 'blue', 'dashArray': '10,10'}},
+    'empty': [],
+}
+
+
+def test_simplify_line_keeps_endpoints_and_drops_collinear_points():
+    coords = [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+    assert simplify_line(coords, tolerance=1e-6) == [[0.0, 0.0], [3.0, 0.0]]
+
+
+def test_simplify_line_keeps_points_beyond_tolerance():
+    coords = [[0.0, 0.0], [1.0, 0.501], [2.0, 1.0], [3.0, 0.0]]
+    assert simplify_line(coords, tolerance=0.01) == [[0.0, 0.0], [2.0, 1.0], [3.0, 0.0]]
+
+
+def test_simplify_line_handles_short_and_closed_lines():
+    assert simplify_line([[1.23456789, 2.0]], tolerance=0.1) == [[1.234568, 2.0]]
+    loop = [[0.0, 0.0], [1.0, 1.0], [0.0, 0.0]]
+    assert simplify_line(loop, tolerance=0.1) == loop
+
+
+def check_payload(payload):
+    text = ''.join(iter_payload(payload))
+    assert json.loads(text) == payload
+    assert '</' not in text
+
+
+def test_iter_payload_with_stdlib_json(monkeypatch):
+    monkeypatch.setattr(map_visualizer, 'orjson', None)
+    check_payload(PAYLOAD)
+
+
+def test_iter_payload_with_orjson(monkeypatch):
+    orjson = pytest.importorskip('orjson')
+    monkeypatch.setattr(map_visualizer, 'orjson', orjson)
+    check_payload(PAYLOAD)
+
+
+def test_fetch_zone_routes_falls_back_to_legs_after_the_zone_pool(monkeypatch, ors_server, ors_client):
+    a, b, c = (125.61, 7.07), (125.615, 7.075), (125.625, 7.065)
+    zones = {'A': [{'coordinates': a}, {'coordinates': b}], 'B': [{'coordinates': c}]}
+    ors_server.unroutable = {(point_key(a), point_key(b))}
+
+    batch_threads = []
+    get_routes_batch = ors_client.get_routes_batch
+
+    def record_thread(pairs):
+        batch_threads.append(threading.current_thread())
+        return get_routes_batch(pairs)
+
+    monkeypatch.setattr(ors_client, 'get_routes_batch', record_thread)
+    routes = MapVisualizer(zones, ors_client).fetch_zone_routes()
+
+    # Only zone A failed as a whole; its fallback ran on the calling thread, outside the zone pool
+    assert batch_threads == [threading.main_thread()]
+    assert [route is None for route in routes['A']] == [False, True, False]
+    assert len(routes['B']) == 2 and None not in routes['B']
@@ -0,0 +1,57 @@
+import pytest
+
+from utils.ors_client import ORSClient, RouteCache
+
+START, END = (125.6199, 7.0709), (125.6001, 7.0712)
+ROUTE = {'type': 'FeatureCollection', 'features': [
+    {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [list(START), list(END)]},
+     'properties': {'segments': [{'distance': 2210.5, 'duration': 301.2}]}}
+]}
+
+
+def test_route_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = RouteCache(path=path, profile='driving-car')
+    cache.put(START, END, ROUTE)
+    assert cache.get(START, END) == ROUTE
+    cache.flush()
+
+    reloaded = RouteCache(path=path, profile='driving-car')
+    assert reloaded.get(START, END) == ROUTE
+    # Routes are directed and per profile
+    assert reloaded.get(END, START) is None
+    assert RouteCache(path=path, profile='cycling-regular').get(START, END) is None
+
+
+def test_route_cache_ignores_float_noise(tmp_path):
+    cache = RouteCache(path=str(tmp_path / 'cache.sqlite'))
+    cache.put(START, END, ROUTE)
+    assert cache.get((START[0] + 1e-9, START[1]), END) == ROUTE
+
+
+def test_get_route_multi_rejects_missing_legs(tmp_path):
+    class ShortDirections:
+        def directions(self, coordinates, **kwargs):
+            # One leg fewer than the waypoints need
+            return {'features': [{
+                'geometry': {'type': 'LineString', 'coordinates': coordinates[:2]},
+                'properties': {'segments': [{'distance': 1.0, 'duration': 1.0}], 'way_points': [0, 1]}
+            }]}
+
+    client = ORSClient.__new__(ORSClient)
+    client.client = ShortDirections()
+    client.profile = 'driving-car'
+    client.route_cache = RouteCache(path=str(tmp_path / 'cache.sqlite'))
+
+    with pytest.raises(ValueError):
+        client.get_route_multi([START, END, START])
+    assert client.route_cache.get(START, END) is None
+
+
+def test_route_cache_accepts_a_bare_filename(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    cache = RouteCache(path='cache.sqlite')
+    cache.put(START, END, ROUTE)
+    cache.flush()
+    assert (tmp_path / 'cache.sqlite').exists()
+    assert RouteCache(path='cache.sqlite').get(START, END) == ROUTE
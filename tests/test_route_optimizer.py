@@ -1,18 +1,124 @@
-delivery-route-optimizer
-├── src
-│   ├── main.py
-│   ├── data
-│   │   └── sample_delivery_data.csv
-│   ├── models
-│   │   └── route_optimizer.py
-│   ├── utils
-│   │   ├── data_loader.py
-│   │   ├── ors_client.py
-│   │   └── map_visualizer.py
-│   └── templates
-│       └── route_map.html
-├── tests
-│   └── test_route_optimizer.py
-├── requirements.txt
-├── config.py
-└── README.md
\ No newline at end of file
+import numpy as np
+import pytest
+from openrouteservice.exceptions import ApiError
+
+from config import HUB_LOCATION
+from conftest import point_key
+from models.route_optimizer import RouteOptimizer, nearest_neighbor_tour, two_opt, nn_then_2opt
+from utils.data_loader import DeliveryDataLoader
+
+SENTINEL = np.finfo(np.float32).max
+
+
+def random_matrix(n, seed, symmetric=False):
+    rng = np.random.default_rng(seed)
+    D = rng.uniform(10, 1000, size=(n, n)).astype(np.float32)
+    if symmetric:
+        D = np.triu(D) + np.triu(D, 1).T
+    np.fill_diagonal(D, 0)
+    return D
+
+
+def tour_cost(D, seq):
+    tour = list(seq) + [0]
+    return float(sum(float(D[a, b]) for a, b in zip(tour[:-1], tour[1:])))
+
+
+def best_2opt_gain(D, seq):
+    """Largest saving of any single segment reversal, by brute force"""
+    base = tour_cost(D, seq)
+    best = 0.0
+    for i in range(1, len(seq)):
+        for j in range(i + 1, len(seq)):
+            moved = seq[:i] + seq[i:j + 1][::-1] + seq[j + 1:]
+            best = max(best, base - tour_cost(D, moved))
+    return best
+
+
+@pytest.mark.parametrize('n', [2, 5, 12])
+def test_nearest_neighbor_tour_is_permutation_from_hub(n):
+    seq = nearest_neighbor_tour(random_matrix(n, seed=n))
+    assert seq[0] == 0
+    assert sorted(seq) == list(range(n))
+
+
+def test_nearest_neighbor_tour_takes_closest_point():
+    D = np.array([[0, 5, 1, 9],
+                  [5, 0, 2, 1],
+                  [1, 2, 0, 7],
+                  [9, 1, 7, 0]], dtype=np.float32)
+    assert nearest_neighbor_tour(D) == [0, 2, 1, 3]
+
+
+@pytest.mark.parametrize('symmetric', [True, False])
+@pytest.mark.parametrize('seed', range(20))
+def test_two_opt_is_2opt_optimal(seed, symmetric):
+    D = random_matrix(10, seed, symmetric)
+    start = nearest_neighbor_tour(D)
+    seq = two_opt(start, D)
+
+    assert seq[0] == 0
+    assert sorted(seq) == list(range(len(D)))
+    assert tour_cost(D, seq) <= tour_cost(D, start) + 1e-3
+    assert best_2opt_gain(D, seq) < 1e-3
+
+
+def test_two_opt_terminates_with_unroutable_stop():
+    D = random_matrix(8, seed=1)
+    D[5, :] = SENTINEL
+    D[:, 5] = SENTINEL
+    D[5, 5] = 0
+
+    seq = two_opt(nearest_neighbor_tour(D), D)
+    assert sorted(seq) == list(range(len(D)))
+
+
+def test_two_opt_leaves_short_tours_alone():
+    D = random_matrix(3, seed=0)
+    assert two_opt([0, 2, 1], D) == [0, 2, 1]
+
+
+def test_nn_then_2opt_returns_array_tour():
+    D = random_matrix(15, seed=3)
+    seq = nn_then_2opt(D)
+    assert isinstance(seq, np.ndarray)
+    assert seq[0] == 0
+    assert sorted(seq.tolist()) == list(range(len(D)))
+
+
+def test_optimize_route_resolves_unroutable_matrix_cells(ors_server, ors_client, delivery_csv):
+    loader = DeliveryDataLoader(delivery_csv)
+    hub, stop = HUB_LOCATION, loader.get_coordinates()[2]
+    ors_server.matrix_gaps = {(point_key(hub), point_key(stop)), (point_key(stop), point_key(hub))}
+
+    optimizer = RouteOptimizer(loader, ors_client)
+    route = optimizer.optimize_route()
+
+    table = optimizer.route_table.set_index('tracking_num')
+    assert table.loc['T3', 'distance_from_hub'] == ors_server.distance(hub, stop)
+    assert table.loc['T3', 'distance_to_hub'] == ors_server.distance(stop, hub)
+    assert (optimizer.route_table[['distance', 'distance_from_hub', 'distance_to_hub']] < 1e6).all().all()
+    assert sorted(stop['tracking_num'] for stop in route) == ['T1', 'T2', 'T3', 'T4', 'T5']
+    # The fallback legs went through the client's JSON encoding as plain coordinate lists
+    assert ors_server.count('directions') == 2
+
+
+def test_optimize_route_rejects_a_leg_with_no_road_route(ors_server, ors_client, delivery_csv):
+    loader = DeliveryDataLoader(delivery_csv)
+    stop = point_key(loader.get_coordinates()[2])
+    ors_server.unroutable = {(point_key(HUB_LOCATION), stop)}
+
+    with pytest.raises(ValueError, match='No road route from point 0 to point 3'):
+        RouteOptimizer(loader, ors_client).optimize_route()
+
+
+def test_optimize_route_passes_other_ors_errors_through(ors_server, ors_client, delivery_csv):
+    loader = DeliveryDataLoader(delivery_csv)
+    stop = point_key(loader.get_coordinates()[2])
+    ors_server.matrix_gaps = {(point_key(HUB_LOCATION), stop)}
+    ors_server.error_status = 400
+
+    with pytest.raises(ApiError) as excinfo:
+        RouteOptimizer(loader, ors_client).optimize_route()
+    assert excinfo.value.status == 400
+    assert not isinstance(excinfo.value, ValueError)
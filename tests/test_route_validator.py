@@ -0,0 +1,89 @@
+import logging
+
+import numpy as np
+
+from config import HUB_LOCATION
+from conftest import point_key
+from models.route_optimizer import RouteOptimizer
+from utils.data_loader import DeliveryDataLoader
+from utils.route_validator import RouteValidator
+
+logger = logging.getLogger(__name__)
+
+
+def optimized(ors_client, delivery_csv):
+    optimizer = RouteOptimizer(DeliveryDataLoader(delivery_csv), ors_client)
+    return optimizer, optimizer.optimize_route()
+
+
+def test_given_matrix_is_used_without_requests(ors_server, ors_client, delivery_csv):
+    optimizer, route = optimized(ors_client, delivery_csv)
+    ors_server.requests.clear()
+
+    validator = RouteValidator(route, HUB_LOCATION, ors_client, logger, road_matrix=optimizer.get_route_matrix())
+    np.testing.assert_array_equal(validator.road_matrix, optimizer.get_route_matrix())
+    assert ors_server.requests == []
+
+
+def test_given_matrix_refetches_only_unroutable_cells(ors_server, ors_client, delivery_csv):
+    optimizer, route = optimized(ors_client, delivery_csv)
+    ors_server.requests.clear()
+    matrix = optimizer.get_route_matrix()
+    expected = matrix.copy()
+    matrix[0, 2] = np.nan
+    matrix[3, 1] = np.finfo(np.float32).max
+
+    validator = RouteValidator(route, HUB_LOCATION, ors_client, logger, road_matrix=matrix)
+    np.testing.assert_allclose(validator.road_matrix, expected, rtol=1e-6)
+    assert ors_server.count('matrix') == 0
+    assert ors_server.count('directions') == 2
+
+
+def test_fetched_matrix_refetches_only_unroutable_cells(ors_server, ors_client, delivery_csv):
+    optimizer, route = optimized(ors_client, delivery_csv)
+    expected = optimizer.get_route_matrix()
+    stop = route[1]['coordinates']
+    hub, stop = point_key(HUB_LOCATION), point_key(stop)
+    ors_server.matrix_gaps = {(hub, stop), (stop, hub)}
+    ors_server.requests.clear()
+
+    validator = RouteValidator(route, HUB_LOCATION, ors_client, logger)
+    np.testing.assert_allclose(validator.road_matrix, expected, rtol=1e-6)
+    assert ors_server.count('matrix') == 1
+    assert ors_server.count('directions') == 2
+
+
+def test_compare_methods_scores_the_nearest_neighbor_route(ors_client, delivery_csv):
+    optimizer, route = optimized(ors_client, delivery_csv)
+    validator = RouteValidator(route, HUB_LOCATION, ors_client, logger, road_matrix=optimizer.get_route_matrix())
+
+    (method, distance_km, time_min, num_stops, *_), = validator.compare_methods()
+    nn_distance, nn_time = validator.calculate_metrics(validator.get_nearest_neighbor_route_detailed())
+    assert method == 'Nearest Neighbor'
+    assert num_stops == len(route)
+    assert distance_km == f"{nn_distance / 1000:.2f}"
+    assert time_min == f"{nn_time:.1f}"
+
+
+def test_failed_matrix_request_fetches_every_pair(ors_server, ors_client, delivery_csv):
+    optimizer, route = optimized(ors_client, delivery_csv)
+    expected = optimizer.get_route_matrix()
+    ors_server.matrix_error_status = 400
+    ors_server.requests.clear()
+
+    validator = RouteValidator(route, HUB_LOCATION, ors_client, logger)
+    np.testing.assert_allclose(validator.road_matrix, expected, rtol=1e-6)
+    size = len(route) + 1
+    assert ors_server.count('directions') == size * size - size
+
+
+def test_redundancy_counts_stops_sharing_a_rounded_area(ors_client):
+    stops = [
+        {'coordinates': (125.61234, 7.07001)},
+        {'coordinates': (125.61236, 7.07001)},  # Rounds to 125.6124, a different area
+        {'coordinates': (125.61231, 7.06999)},  # Same area as the first stop
+        {'coordinates': (125.61234, 7.07001)},  # Same point as the first stop
+    ]
+    validator = RouteValidator(stops, HUB_LOCATION, ors_client, logger)
+    metrics = validator.calculate_extended_metrics(stops, total_time=40.0)
+    assert metrics == {'num_stops': 4, 'avg_time_per_stop': 10.0, 'redundant_paths': 2}